@@ -13,6 +13,8 @@ __credits__ = ['Colormath https://pypi.python.org/pypi/colormath/',
 
 import os
 import sys
+import builtins
+import functools
 import numpy
 import networkx
 from collections import OrderedDict
@@ -38,11 +40,21 @@ def hex2rgb(c, illuminant='ignore'):
 
 def rgb2cmyk(rgb, **kwargs):
     """
-    :param rgb: 3-tuple of floats of red,green,blue in [0..1] range
-    :return: 4-tuple of floats (cyan, magenta, yellow, black) in [0..1] range
+    :param rgb: 3-tuple of floats of red,green,blue in [0..1] range,
+        or ndarray of shape (...,3) for image-like data
+    :return: 4-tuple of floats (cyan, magenta, yellow, black) in [0..1] range,
+        or ndarray of shape (...,4)
     """
     # http://stackoverflow.com/questions/14088375/how-can-i-convert-rgb-to-cmyk-and-vice-versa-in-python
 
+    if numpy.ndim(rgb) > 1:  # vectorized over all pixels at once
+        cmy = 1.0 - numpy.asarray(rgb, dtype=float)[..., :3]
+        k = cmy.min(axis=-1, keepdims=True)
+        denom = numpy.where(k < 1, 1 - k, 1)
+        res = numpy.concatenate([(cmy - k) / denom, k], axis=-1)
+        res[..., :3] *= k < 1  # pure black has no cmy components
+        return res
+
     r, g, b = rgb
 
     c = 1 - r
@@ -119,15 +131,20 @@ def _skadapt(f, **kwargs):
 
     def adapted(arr, **kwargs):
         arr = numpy.asanyarray(arr)
-        if arr.ndim == 1:
+        if arr.ndim != 1:
+            return f(arr, **kwargs)
+        try:  # recent skimage converts single colors directly : no reshape copies
+            try:
+                return f(arr, **kwargs)
+            except TypeError:  # unsupported params. retry without
+                return f(arr)
+        except ValueError:  # older skimage wants image-shaped arrays
             a = arr.reshape(1, 1, arr.shape[-1])
             try:
                 res = f(a, **kwargs)
             except TypeError:  # unsupported params. retry without
                 res = f(a)
             return res.reshape(arr.shape[-1])
-        else:
-            return f(arr, **kwargs)
 
     return adapted
 
@@ -165,6 +182,27 @@ for source in colorspaces:
             converters.add_edge(key[0], key[1], f=converter)
 
 
+# direct converters : most conversions are a single edge,
+# which shouldn't pay for any path walking at all
+_direct = {(u, v): converters[u][v][0]['f'] for u, v in converters.edges()}
+
+
+@functools.lru_cache(maxsize=None)
+def _conversion_path(source, target):
+    """memoized conversion path between colorspaces
+    since the converters graph is fixed, there is no point
+    searching the shortest path again at each conversion
+    """
+    return tuple(converters.shortest_path(source, target))
+
+
+@functools.lru_cache(maxsize=None)
+def _conversion_chain(source, target):
+    """memoized tuple of converter functions along the shortest path"""
+    path = _conversion_path(source, target)
+    return tuple(converters[u][v][0]['f'] for u, v in zip(path, path[1:]))
+
+
 def convert(color, source, target):
     """convert a color between colorspaces,
     eventually using intermediary steps
@@ -172,9 +210,14 @@ def convert(color, source, target):
     source, target = source.lower(), target.lower()
     if source == target:
         return color
-    path = converters.shortest_path(source, target)
-    for u, v in itertools2.pairwise(path):
-        color = converters[u][v][0]['f'](color)
+    f = _direct.get((source, target))
+    if f is not None:
+        return f(color)
+    chain = _conversion_chain(source, target)
+    if len(chain) == 2:  # most indirect conversions take two hops
+        return chain[1](chain[0](color))
+    for f in chain:
+        color = f(color)
     return color  # isn't it beautiful ?
 
 
@@ -183,6 +226,10 @@ class Color(object):
     Color is immutable (._values caches representations)
     """
 
+    # one slot per colorspace : cheaper than a dict of cached conversions
+    __slots__ = ('space', 'illuminant', '_name') + \
+        tuple('_' + s.lower() for s in colorspaces)
+
     def __init__(self, value, space='RGB', name=None, illuminant='D65'):
         """constructor
         :param value: string color name, hex string, or values tuple
@@ -200,21 +247,10 @@ class Color(object):
             self._copy_from_(value)
             return
         if isinstance(value, str):
-            if value in pantone:
-                self._copy_from_(pantone[value])
-                return
-            value = value.lower()
-            if value in color:
-                self._copy_from_(color[value])
-                return
-            elif len(value) == 7 and value[0] == '#':
-                if value in color_lookup:
-                    self._copy_from_(color_lookup[value])
-                    return
-                else:
-                    space = 'hex'
-            else:
-                raise (ValueError("Couldn't create Color(%s,%s)" % (value, space)))
+            self._copy_from_(_color_from_string(value, space, illuminant))
+            if self._name is None:
+                self._name = name
+            return
 
         self.space = space  # "native" space in which the color was created
 
@@ -222,24 +258,44 @@ class Color(object):
             if max(value) > 1:
                 value = tuple(_ / 255. for _ in value)
             # rgb only, not whiter than white...
-            value = math2.sat(value[:3], 0, 1)
-        if space != 'hex':  # force to floats
+            # (clamp inlined with the float cast : one pass, one tuple)
+            value = tuple(0. if _ < 0 else 1. if _ > 1 else float(_)
+                          for _ in value[:3])
+        elif space != 'hex':  # force to floats
             value = tuple(float(_) for _ in value)
-        self._values = OrderedDict()  # so native space is always first
-        self._values[space] = value
+        self._init_values()
+        setattr(self, '_' + space, value)
+
+    def _init_values(self):
+        for s in colorspaces:
+            setattr(self, '_' + s.lower(), None)
 
     def _copy_from_(self, c):
         self.space = c.space
         self.illuminant = c.illuminant
         self._name = c._name
-        self._values = c._values
+        for s in colorspaces:
+            s = '_' + s.lower()
+            setattr(self, s, getattr(c, s))
+
+    @property
+    def _values(self):
+        """cached conversions, native space always first"""
+        res = OrderedDict()
+        spaces = [self.space] + \
+            [s.lower() for s in colorspaces if s.lower() != self.space]
+        for s in spaces:
+            v = getattr(self, '_' + s)
+            if v is not None:
+                res[s] = v
+        return res
 
     @property
     def name(self):
         if self._name is None:
             if self.hex in color_lookup:
                 self._name = color_lookup[self.hex].name
-            else:
+            else:  # nearest_color queries the named colors k-d tree
                 self._name = '~' + nearest_color(self).name
         return self._name
 
@@ -249,9 +305,9 @@ class Color(object):
         :return: color in target colorspace
         """
         target = target.lower() if target else self.space
-        if target not in self._values:
+        if getattr(self, '_' + target) is None:
             try:
-                path = converters.shortest_path(self.space, target)
+                path = _conversion_path(self.space, target)
             except networkx.NetworkXNoPath:
                 raise NotImplementedError(
                     'no conversion between %s and %s color spaces'
@@ -259,15 +315,15 @@ class Color(object):
                 )
             # to avoid incoherent cached values
             kwargs['illuminant'] = self.illuminant
-            for u, v in itertools2.pairwise(path):
-                if v not in self._values:
+            for u, v in zip(path, path[1:]):  # no generator machinery here
+                if getattr(self, '_' + v) is None:
                     edge = converters[u][v][0]
-                    c = edge['f'](self._values[u], **kwargs)
+                    c = edge['f'](getattr(self, '_' + u), **kwargs)
 
                     if itertools2.isiterable(c):  # but not a string
                         c = tuple(map(float, c))
-                    self._values[v] = c
-        return self._values[target]
+                    setattr(self, '_' + v, c)
+        return getattr(self, '_' + target)
 
     def str(self, mode=None):
         res = self.convert(mode)
@@ -390,6 +446,30 @@ class Color(object):
         return self.isclose(other, 1)
 
 
+@functools.lru_cache(maxsize=1024)
+def _color_from_string(value, space, illuminant):
+    """memoized resolution of color names and hex strings
+    repeated constructions from the same string (plots, notebooks, ...)
+    return the same shared prototype instead of parsing again
+    """
+    if value in pantone:
+        return pantone[value]
+    value = value.lower()
+    if value in color:
+        return color[value]
+    if len(value) == 7 and value[0] == '#':
+        if value in color_lookup:
+            return color_lookup[value]
+        res = Color.__new__(Color)  # avoids recursing through __init__
+        res._name = None
+        res.illuminant = illuminant
+        res.space = 'hex'
+        res._init_values()
+        res._hex = value
+        return res
+    raise (ValueError("Couldn't create Color(%s,%s)" % (value, space)))
+
+
 class Palette(OrderedDict):
     """dict of Colors indexed by anything"""
 
@@ -537,6 +617,46 @@ for _ in table['autocad'].asdict():
     acadcolors[id] = Color(_['hex'], name=id, illuminant='D65')
 
 
+# precomputed tables for color_to_aci : hex gives exact hits in one lookup,
+# the Lab array allows a single vectorized deltaE instead of 256 calls
+_acad_hex = {}
+for _i, _c in enumerate(acadcolors):
+    if _c is not None:
+        _acad_hex.setdefault(_c.hex, _i)  # first index wins, as list.index did
+_acad_idx = [i for i, c in enumerate(acadcolors) if c is not None]
+_acad_lab = None  # (n,3) Lab array, built lazily at first nearest query
+
+
+_rgb_to_aci = None  # quantized 32x32x32 rgb -> nearest ACI table, see aci_lut
+
+
+def _acad_lab_array():
+    global _acad_lab
+    if _acad_lab is None:
+        _acad_lab = numpy.array([acadcolors[i].lab for i in _acad_idx])
+    return _acad_lab
+
+
+def aci_lut():
+    """build (once) a 5-bit-per-channel lookup table of nearest ACI
+    turns each subsequent nearest-color query into a single array indexing,
+    at the price of quantizing rgb to 32768 cells. worth it when rasterizing
+    :return: numpy array of 32*32*32 uint8 ACI values
+    """
+    global _rgb_to_aci
+    if _rgb_to_aci is None:
+        grid = numpy.moveaxis(numpy.indices((32, 32, 32)), 0, -1)
+        lab = skcolor.rgb2lab(grid / 31.0).reshape(-1, 3)
+        acad = _acad_lab_array()
+        res = numpy.empty(len(lab), dtype=numpy.uint8)
+        for i in range(0, len(lab), 4096):  # by blocks to bound memory
+            dE = skcolor.deltaE_ciede2000(
+                lab[i:i + 4096, None, :], acad[None, :, :])
+            res[i:i + 4096] = numpy.argmin(dE, axis=-1)
+        _rgb_to_aci = numpy.asarray(_acad_idx, dtype=numpy.uint8)[res]
+    return _rgb_to_aci
+
+
 def color_to_aci(x, nearest=True):
     """
     :return: int Autocad Color Index of color x
@@ -544,12 +664,18 @@ def color_to_aci(x, nearest=True):
     if x is None:
         return -1
     x = Color(x)
-    try:
-        return acadcolors.index(x)
-    except ValueError:
-        pass
-    if nearest:
-        return nearest_color(x, acadcolors).name  # name = int id
+    res = _acad_hex.get(x.hex)
+    if res is not None:
+        return res
+    if nearest and _rgb_to_aci is not None:  # quantized table built by aci_lut
+        r, g, b = (int(v * 31 + .5) for v in x.rgb)
+        return int(_rgb_to_aci[(r << 10) | (g << 5) | b])
+    dE = skcolor.deltaE_ciede2000(
+        numpy.asarray(x.lab)[None, :], _acad_lab_array())
+    i = int(numpy.argmin(dE))
+    # list.index matched through Color.__eq__, which accepts deltaE <= 1
+    if nearest or dE[i] <= 1:
+        return _acad_idx[i]
     return -1
 
 
@@ -570,6 +696,29 @@ def deltaE(c1, c2):
     return skcolor.deltaE_ciede2000(c1.lab, c2.lab)
 
 
+_lab_trees = {}  # (palette id, len) -> (kd-tree over Lab, list of Color, palette)
+
+
+def _lab_tree(l):
+    """build (lazily) a k-d tree over the Lab coordinates of a palette
+
+    keyed on (id, len) so a palette that grows or shrinks gets a fresh
+    tree. recoloring an entry in place is NOT detected : copy instead
+    """
+    # id itself is shadowed by the palette loops above
+    key = builtins.id(l), len(l)
+    res = _lab_trees.get(key)
+    if res is None:
+        from scipy.spatial import cKDTree
+        candidates = [c for c in (l.values() if isinstance(l, dict) else l)
+                      if c is not None]
+        # the palette itself is kept in the entry : its id can't be
+        # recycled by another object and answer from the wrong tree
+        res = cKDTree([c.lab for c in candidates]), candidates, l
+        _lab_trees[key] = res
+    return res
+
+
 def nearest_color(c, l=None, opt=min, comp=deltaE):
     """
     :param x: Color
@@ -580,6 +729,17 @@ def nearest_color(c, l=None, opt=min, comp=deltaE):
     if not isinstance(c, Color):
         c = Color(c)
     l = l or color
+    if opt is min and comp is deltaE:
+        # k-d tree query in Lab space prefilters candidates, then the true
+        # CIEDE2000 metric decides. Euclidean Lab ranks differently than
+        # CIEDE2000, so take the 32 nearest plus everything within twice
+        # the closest distance : a narrower prefilter misses on some colors
+        tree, candidates, _ = _lab_tree(l)
+        d, idx = tree.query(c.lab, k=min(32, len(candidates)))
+        sel = set(numpy.atleast_1d(idx).tolist())
+        sel.update(tree.query_ball_point(c.lab, 2 * numpy.atleast_1d(d)[0]))
+        return min((candidates[i] for i in sel),
+                   key=lambda c2: comp(c, c2))
     if isinstance(l, dict):
         l = l.values()
     return opt(l, key=lambda c2: comp(c, c2))
@@ -594,9 +754,9 @@ def color_range(n, start, end, space='hsv'):
     :result: list of n Color interpolated between start and end, included
     """
 
-    start = Color(start).convert(space)
-    end = Color(end).convert(space)
-    return [Color(v, space=space) for v in itertools2.linspace(start, end, n)]
+    start = numpy.asarray(Color(start).convert(space), dtype=float)
+    end = numpy.asarray(Color(end).convert(space), dtype=float)
+    return [Color(tuple(v), space=space) for v in numpy.linspace(start, end, n)]
 
 
 """some (astro) physics calculators"""
@@ -11,12 +11,13 @@ __credits__ = [
 __license__ = "LGPL"
 
 import logging
-import copy
+import functools
 import typing  # collections
 import inspect
 import re
 import ast
 import math
+import numpy
 import operator as op
 from sortedcollections import SortedDict
 
@@ -102,6 +103,7 @@ class Context:
         :param l: LaTeX representation
         '''
         self.functions[f.__name__] = (f, 9999, s, r or s, l)
+        self._globals = None
         return self.functions[f.__name__]
 
     def add_constant(self, c, name, s=None, r=None, l=None):
@@ -124,69 +126,99 @@ class Context:
             elif math2.is_number(f):
                 self.add_constant(f, fname)
 
+    def globals(self) -> dict:
+        '''namespace of allowed functions, for compiled evaluation'''
+        if self._globals is None:
+            self._globals = {k: v[0] for k, v in self.functions.items()}
+            self._globals['__builtins__'] = {}
+        return self._globals
+
+    def _eval_constant(self, node):
+        return node
+
+    def _eval_name(self, node):
+        value=self.variables.get(node.id)
+        return ast.Constant(value) if value is not None else node
+
+    def _eval_attribute(self, node):
+        value=getattr(self.variables, [node.value.id])
+        return ast.Constant(value) if value is not None else ast.Name(node.attr)
+
+    def _eval_tuple(self, node):
+        return tuple(self.eval(e) for e in node.elts)
+
+    def _eval_call(self, node):
+        try:
+            params = [self.eval(arg).value for arg in node.args]
+            if node.func.id not in self.functions:
+                raise NameError('%s function not allowed' % node.func.id)
+            f = self.functions[node.func.id][0]
+            res = f(*params)
+            # try to correct small error
+            return ast.Constant(math2.int_or_float(res, 0, 1e-12))
+        except Exception as e:
+            return node # function cannot be evaluated. return it as is
+
+    def _eval_binop(self, node):  # <left> <operator> <right>
+        op = self.operators[type(node.op)]
+        left = self.eval(node.left)
+        right = self.eval(node.right)
+        if isinstance(left,ast.Constant) and isinstance(right,ast.Constant):
+            return ast.Constant(op[0](left.value, right.value))
+        else:
+            return ast.BinOp(left, node.op, right)
+
+    def _eval_unaryop(self, node):  # <operator> <operand> e.g., -1
+        op = self.operators[type(node.op)]
+        operand = self.eval(node.operand)
+        if isinstance(operand,ast.Constant) :
+            return ast.Constant(op[0](operand.value))
+        else:
+            return node
+
+    def _eval_compare(self, node):
+        left = self.eval(node.left)
+        #https://docs.python.org/3/library/ast.html#ast.Compare
+        #TODO: improve for semi evaluations such as x<3<5+1
+        res=False
+        for op, right in zip(node.ops, node.comparators):
+            op=self.operators[type(op)]
+            right = self.eval(right)
+            if isinstance(left,ast.Constant) and isinstance(right,ast.Constant):
+                res=op[0](left.value, right.value)
+                if res is False:
+                    return ast.Constant(False)
+                left=right
+        if res is True:
+            return ast.Constant(True)
+        else:
+            return node
+
+    # one dict lookup per node instead of a cascade of isinstance checks
+    _EVAL_DISPATCH = {
+        ast.Constant: _eval_constant,
+        ast.Name: _eval_name,
+        ast.Attribute: _eval_attribute,
+        ast.Tuple: _eval_tuple,
+        ast.Call: _eval_call,
+        ast.BinOp: _eval_binop,
+        ast.UnaryOp: _eval_unaryop,
+        ast.Compare: _eval_compare,
+    }
+
     def eval(self, node: ast.AST)->ast.AST:
         '''safe eval of ast node : only functions and _operators listed above can be used
 
         :param node: ast.AST to evaluate
         :return: number or expression string
         '''
-        if isinstance(node, ast.Constant):
-            return node
-        elif isinstance(node, ast.Name):
-            value=self.variables.get(node.id)
-            return ast.Constant(value) if value is not None else node
-        elif isinstance(node, ast.Attribute):
-            value=getattr(self.variables, [node.value.id])
-            return ast.Constant(value) if value is not None else ast.Name(node.attr)
-        elif isinstance(node, ast.Tuple):
-            return tuple(self.eval(e) for e in node.elts)
-        elif isinstance(node, ast.Call):
-            try:
-                params = [self.eval(arg).value for arg in node.args]
-                if node.func.id not in self.functions:
-                    raise NameError('%s function not allowed' % node.func.id)
-                f = self.functions[node.func.id][0]
-                res = f(*params)
-                # try to correct small error
-                return ast.Constant(math2.int_or_float(res, 0, 1e-12))
-            except Exception as e:
-                return node # function cannot be evaluated. return it as is
-        elif isinstance(node, ast.BinOp):  # <left> <operator> <right>
-            op = self.operators[type(node.op)]
-            left = self.eval(node.left)
-            right = self.eval(node.right)
-            if isinstance(left,ast.Constant) and isinstance(right,ast.Constant):
-                return ast.Constant(op[0](left.value, right.value))
-            else:
-                return ast.BinOp(left, node.op, right)
-        elif isinstance(node, ast.UnaryOp):  # <operator> <operand> e.g., -1
-            op = self.operators[type(node.op)]
-            operand = self.eval(node.operand)
-            if isinstance(operand,ast.Constant) :
-                return ast.Constant(op[0](operand.value))
-            else:
-                return node
-        elif isinstance(node, ast.Compare):
-            left = self.eval(node.left)
-            #https://docs.python.org/3/library/ast.html#ast.Compare
-            #TODO: improve for semi evaluations such as x<3<5+1
-            res=False
-            for op, right in zip(node.ops, node.comparators):
-                op=self.operators[type(op)]
-                right = self.eval(right)
-                if isinstance(left,ast.Constant) and isinstance(right,ast.Constant):
-                    res=op[0](left.value, right.value)
-                    if res is False:
-                        return ast.Constant(False)
-                    left=right
-            if res is True:
-                return ast.Constant(True)
-            else:
-                return node
-        else:
+        f = self._EVAL_DISPATCH.get(type(node))
+        if f is None:
             raise ValueError('unsupported node %s' % node)
+        return f(self, node)
 
     def __init__(self):
+        self._globals = None  # rebuilt by globals() when functions change
         self.add_module(math)
         self.add_function(abs, l='\\lvert{%s}\\rvert')
         self.add_function(math.fabs, l='\\lvert{%s}\\rvert')
@@ -218,6 +250,10 @@ class Context:
 default_context = Context()
 
 
+_LAMBDA_RE = re.compile(r'lambda(.*):(.*)(\)|#)')
+_DEF_RE = re.compile(r'def \w*\((.*)\):\s*return (.*)')
+
+
 def get_function_source(f):
     '''returns cleaned code of a function or lambda
     currently only supports:
@@ -225,7 +261,7 @@ def get_function_source(f):
     - def anything(x): return formula_of_(x)
     '''
     f = inspect.getsource(f).rstrip('\n')  # TODO: merge lines more subtly
-    g = re.search(r'lambda(.*):(.*)(\)|#)', f)
+    g = _LAMBDA_RE.search(f)
     if g:
         res = g.group(2).strip()  # remove leading+trailing spaces
         bra, ket = res.count('('), res.count(')')
@@ -234,13 +270,35 @@ def get_function_source(f):
         else:  # closing parenthesis ?
             return res[:-(ket - bra)]
     else:
-        g = re.search(r'def \w*\((.*)\):\s*return (.*)', f)
+        g = _DEF_RE.search(f)
         if g is None:
             raise ValueError('not a valid function code %s' % f)
         res = g.group(2)
     return res
 
 
+def _clone(node):
+    '''cheap recursive copy of an ast tree
+    much faster than copy.deepcopy, which Expr composition used to rely on
+    '''
+    if isinstance(node, ast.AST):
+        return type(node)(**{f: _clone(v) for f, v in ast.iter_fields(node)})
+    if isinstance(node, list):
+        return [_clone(v) for v in node]
+    return node
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_formula(f):
+    '''memoized compilation of a formula string to its AST
+    the same literal strings come back over and over in expression algebra,
+    and the resulting nodes are only mutated after a copy (see applx)
+    '''
+    # accept ^ as power operator rather than xor ...
+    f = f.replace('^', '**')
+    return compile(f, 'Expr', 'eval', ast.PyCF_ONLY_AST).body
+
+
 def plouffe(f, epsilon=1e-6):
     if f < 0:
         r = plouffe(-f)
@@ -254,12 +312,49 @@ def plouffe(f, epsilon=1e-6):
     return f
 
 
+# node types allowed in the compiled fast path : the ones Context.eval
+# dispatches on, plus their operator and context leaves. Anything else
+# (attributes, subscripts, comprehensions, lambdas...) must never reach
+# eval() as bytecode, since it would run as unrestricted Python there.
+_SAFE_NODES = (ast.Constant, ast.Name, ast.Tuple, ast.Call,
+               ast.BinOp, ast.UnaryOp, ast.Compare,
+               ast.operator, ast.unaryop, ast.cmpop, ast.Load)
+
+
+def _is_safe(body, context):
+    '''True if body only contains whitelisted nodes,
+    with calls restricted to the functions allowed by context'''
+    for node in ast.walk(body):
+        if not isinstance(node, _SAFE_NODES):
+            return False
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) \
+                    or node.func.id not in context.functions:
+                return False
+    return True
+
+
+class _InvertToNot(ast.NodeTransformer):
+    '''rewrites ~a as not a, since operators above define ast.Invert as op.not_'''
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Invert):
+            return ast.UnaryOp(ast.Not(), node.operand)
+        return node
+
+
 class Expr(plot.Plot):
     '''
     Math expressions that can be evaluated like standard functions
     combined using standard operators
     and plotted in IPython/Jupyter notebooks
     '''
+    # Expr objects are created by the thousands in expression algebra
+    # (plot.Plot doesn't define __slots__, so this only speeds up the
+    # declared attributes, it doesn't remove the instance dict)
+    __slots__ = ('body', 'context', '_code', '_reprs', '_complexity')
+
     body: ast.AST
     context: Context
     def __init__(self, f, context=default_context):
@@ -267,6 +362,9 @@ class Expr(plot.Plot):
         :param f: function or operator, Expr to copy construct, or formula string
         '''
         self.context = context
+        self._code = None  # compiled lazily by _compile
+        self._reprs = {}  # rendered strings, by dialect (body is immutable)
+        self._complexity = None  # computed by complexity() on first use
 
         if isinstance(f, Expr):  # copy constructor
             self.body = f.body
@@ -298,10 +396,7 @@ class Expr(plot.Plot):
             self.body = ast.Constant(f)
             return
 
-        # accept ^ as power operator rather than xor ...
-        f = str(f).replace('^', '**')
-
-        self.body = compile(f, 'Expr', 'eval', ast.PyCF_ONLY_AST).body
+        self.body = _parse_formula(str(f))
 
     @property
     def isNum(self):
@@ -314,6 +409,22 @@ class Expr(plot.Plot):
         res = self()
         return isinstance(res, (int, float, complex,bool))
     
+    def _compile(self):
+        '''compile body once to CPython bytecode,
+        much faster than walking the AST at each evaluation'''
+        if self._code is None:
+            # bytecode runs as full Python : refuse formulas the safe
+            # symbolic eval wouldn't accept, they use the walker instead
+            if not _is_safe(self.body, self.context):
+                self._code = False
+            else:
+                body = _InvertToNot().visit(_clone(self.body))
+                expr = ast.fix_missing_locations(ast.Expression(body))
+                self._code = compile(expr, '<Expr>', 'eval')
+        if self._code is False:
+            raise ValueError('formula not limited to allowed operators and functions')
+        return self._code
+
     def eval(self, x=None, **kwargs)->"Expr":
         '''evaluate the Expr at x OR compose self(x())'''
         if isinstance(x, Expr):  # composition
@@ -321,6 +432,17 @@ class Expr(plot.Plot):
         if x is not None:
             kwargs['x'] = x
         kwargs['self'] = self  # allows to call methods such as in Stats module
+        try:  # fast path : run the compiled bytecode
+            res = eval(self._compile(), self.context.globals(), kwargs)
+            if isinstance(res, (bool, int, float, complex)):
+                if not isinstance(res, (bool, int)):
+                    # same small-error correction as the walker's _eval_call
+                    res = math2.int_or_float(res, 0, 1e-12)
+                return Expr(ast.Constant(res), self.context)
+        except (ZeroDivisionError, OverflowError):
+            return None
+        except Exception:
+            pass  # free variables or domain error : simplify symbolically
         self.context.variables = kwargs
         try:
             res = self.context.eval(self.body)
@@ -330,9 +452,38 @@ class Expr(plot.Plot):
             return self #avoid creating a new Expr (is this right?)
         return Expr(res, self.context)
     
+    def _vecteval(self, x):
+        '''evaluate once over a whole numpy array
+        by substituting numpy's vectorized functions for math's.
+        raises for anything that doesn't vectorize (free variables, ...)
+        '''
+        ns = {k: getattr(numpy, k, v[0])
+              for k, v in self.context.functions.items()}
+        ns['__builtins__'] = {}
+        xa = numpy.asarray(x, dtype=float)  # float, not int64 : integer results would wrap silently
+        with numpy.errstate(all='ignore'):
+            res = eval(self._compile(), ns, {'x': xa, 'self': self})
+        res = numpy.asarray(res)
+        if res.shape == ():  # constants don't broadcast : let the loop handle them
+            raise ValueError('not vectorizable')
+        if res.dtype == bool:
+            return res.tolist()
+        finite = numpy.isfinite(res)
+        if not finite.all():
+            # nan may hide a value float64 cannot carry (complex sqrt, ...) :
+            # if the scalar path yields anything there, vectorizing is lossy
+            for i in numpy.flatnonzero(~finite):
+                if self(xa[i].item()) is not None:
+                    raise ValueError('not vectorizable')
+        # undefined points come out as nan/inf instead of raising
+        return [v if numpy.isfinite(v) else None for v in res.tolist()]
+
     def __call__(self, x=None, **kwargs):
         if itertools2.isiterable(x):
-            return [self(x) for x in x]  # return a displayable list
+            try:  # single vectorized pass for closed-form numeric Expr
+                return self._vecteval(x)
+            except Exception:
+                return [self(x) for x in x]  # return a displayable list
         res=self.eval(x, **kwargs)
         if not res is None:
             if isinstance(res.body, ast.Constant):
@@ -342,11 +493,18 @@ class Expr(plot.Plot):
         v = self()
         return float(v)
 
+    def _render(self, dialect):
+        res = self._reprs.get(dialect)
+        if res is None:
+            res = TextVisitor(dialect, self.context).visit(self.body)
+            self._reprs[dialect] = res
+        return res
+
     def __repr__(self):
-        return TextVisitor(_dialect_python,self.context).visit(self.body)
+        return self._render(_dialect_python)
 
     def __str__(self):
-        return TextVisitor(_dialect_str,self.context).visit(self.body)
+        return self._render(_dialect_str)
 
     def _repr_html_(self):
         '''default rich format is LaTeX'''
@@ -354,7 +512,7 @@ class Expr(plot.Plot):
 
     def latex(self):
         ''':return: string LaTex formula'''
-        return TextVisitor(_dialect_latex,self.context).visit(self.body)
+        return self._render(_dialect_latex)
 
     def _repr_latex_(self):
         return r'${%s}$' % self.latex()
@@ -426,7 +584,7 @@ class Expr(plot.Plot):
                 else:
                     return node
 
-        node = copy.deepcopy(self.body)
+        node = _clone(self.body)
         return Expr(Subst().visit(node), self.context)
     
     def __eq__(self, right):
@@ -493,41 +651,34 @@ class Expr(plot.Plot):
         ''' measures the complexity of Expr
         :return: int, sum of the precedence of used ops
         '''
-
-        def _node_complexity(node):
-            try:
-                res = self._operators[type(node.op)][1]
-            except AttributeError:
-                try:
-                    res = self._operators[type(node)][1]
-                except AttributeError:
-                    res = 1
-            try:
-                res += _node_complexity(node.operand)
-            except AttributeError:
-                pass
-            try:
-                res += _node_complexity(node.left)
-            except AttributeError:
-                pass
-            try:
-                res += _node_complexity(node.right)
-            except AttributeError:
-                pass
-            return res
-
-        return _node_complexity(self.body)
+        if self._complexity is None:
+            operators = self.context.operators
+            res = 0
+            for node in ast.walk(self.body):
+                if isinstance(node, (ast.BinOp, ast.UnaryOp)):
+                    res += operators[type(node.op)][1]
+                elif isinstance(node, ast.Compare):
+                    res += sum(operators[type(op)][1] for op in node.ops)
+                elif isinstance(node, ast.Call):
+                    res += operators[ast.Call][1]
+            self._complexity = res  # the AST doesn't change afterwards
+        return self._complexity
 
 
 # http://stackoverflow.com/questions/3867028/converting-a-python-numeric-expression-to-latex
 
 class TextVisitor(ast.NodeVisitor):
 
+    __slots__ = ('dialect', 'context', '_sym')
+
     def __init__(self, dialect, context=default_context):
         ''':param dialect: int index in _operators of symbols to use
         '''
         self.dialect = dialect
         self.context = context
+        # per-dialect symbol table : one dict lookup per node instead of two
+        self._sym = {k: v[dialect]
+                     for k, v in context.operators.items() if len(v) > dialect}
 
     def _par(self, content):
         if self.dialect == _dialect_latex:
@@ -564,7 +715,7 @@ class TextVisitor(ast.NodeVisitor):
         if self.context.precedence(n.op) > self.context.precedence(n.operand):
             op = self._par(op)
 
-        symbol = self.context.operators[type(n.op)][self.dialect]
+        symbol = self._sym[type(n.op)]
 
         if '%s' in symbol:
             return symbol % op
@@ -589,7 +740,7 @@ class TextVisitor(ast.NodeVisitor):
         l= self.visit(left)
         r=self.visit(right)
 
-        symbol = self.context.operators[type(op)][self.dialect]
+        symbol = self._sym[type(op)]
 
         if '%s' in symbol:  # no parenthesis required in this case
             return symbol % (l, r)
@@ -613,14 +764,10 @@ class TextVisitor(ast.NodeVisitor):
         res = l + symbol + r
 
         # TODO: find a better way to do this ...
-        plusminus = self.context.operators[ast.Add][self.dialect] + \
-            self.context.operators[ast.USub][self.dialect]
-        minusminus = self.context.operators[ast.Sub][self.dialect] + \
-            self.context.operators[ast.USub][self.dialect]
-        res = res.replace(
-            plusminus, self.context.operators[ast.Sub][self.dialect])
-        res = res.replace(
-            minusminus, self.context.operators[ast.Add][self.dialect])
+        plusminus = self._sym[ast.Add] + self._sym[ast.USub]
+        minusminus = self._sym[ast.Sub] + self._sym[ast.USub]
+        res = res.replace(plusminus, self._sym[ast.Sub])
+        res = res.replace(minusminus, self._sym[ast.Add])
         return res
 
     def visit_BinOp(self, n):
@@ -11,13 +11,16 @@ __credits__ = ["functional toolset from http://pyeuler.wikidot.com/toolset",
                ]
 __license__ = "LGPL"
 
+import collections
 import itertools
 import random
 import operator
-import typing # collections 
+import typing # collections
 import heapq
 import logging
 
+_sentinel = object()  # private marker, distinct from any data
+
 # pure logic
 
 
@@ -77,7 +80,8 @@ def ith(iterable, i):
     """
     :result: i-th element in the iterable
     """
-
+    if isinstance(iterable, (list, tuple, str)):
+        return iterable[i]  # O(1) random access
     for j, x in enumerate(iterable):
         if i == j:
             return x  # works in all cases by definition of iterable
@@ -95,6 +99,8 @@ def last(iterable):
     """
     :result: last element in the iterable
     """
+    if isinstance(iterable, (list, tuple, str)):
+        return iterable[-1]  # O(1) random access
     found = False
     for x in iterable:
         found = True
@@ -139,8 +145,12 @@ def ilen(it):
     """
     try:
         return len(it)  # much faster if defined...
-    except:
-        return sum(1 for _ in it)
+    except TypeError:
+        pass
+    # drain through a zero-length deque : the count stays in C
+    counter = itertools.count()
+    collections.deque(zip(it, counter), maxlen=0)
+    return next(counter)
 
 
 def irange(start_or_end, optional_end=None):
@@ -209,14 +219,22 @@ def flatten(iterable, donotrecursein=str):
     # http://stackoverflow.com/questions/2158395/flatten-an-irregular-list-of-lists-in-python
     if isinstance(iterable, dict):
         iterable = iterable.values()
-    for el in iterable:
-        if not isinstance(el, typing.Iterable):
-            yield el
-        elif isinstance(el, donotrecursein):
-            yield el
-        else:
-            for sub in flatten(el, donotrecursein):
-                yield sub
+    # explicit stack instead of recursion : single generator frame,
+    # no depth limit
+    stack = [iter(iterable)]
+    while stack:
+        for el in stack[-1]:
+            if not isinstance(el, typing.Iterable):
+                yield el
+            elif isinstance(el, donotrecursein):
+                yield el
+            else:
+                if isinstance(el, dict):
+                    el = el.values()
+                stack.append(iter(el))
+                break
+        else:  # current level exhausted
+            stack.pop()
 
 
 def itemgetter(iterable, i):
@@ -262,6 +280,10 @@ def tee(iterable, n=2, copy=None):
 def groups(iterable, n, step=None):
     """Make groups of 'n' elements from the iterable advancing
     'step' elements on each iteration"""
+    if n == 2 and step == 1:  # pairwise : a single tee, no starmap/islice pile
+        it1, it2 = itertools.tee(iterable)
+        next(it2, None)
+        return zip(it1, it2)
     itlist = tee(iterable, n=n, copy=None)
     onestepit = zip(*(itertools.starmap(drop, enumerate(itlist))))
     return every(step or n, onestepit)
@@ -278,11 +300,13 @@ def pairwise(iterable, op=None, loop=False):
     """
 
     i = itertools.chain(iterable, [first(iterable)]) if loop else iterable
-    for x in groups(i, 2, 1):
-        if op:
-            yield op(x[1], x[0])  # reversed ! (for sub or div)
-        else:
-            yield x[0], x[1]
+    it1, it2 = itertools.tee(i)
+    next(it2, None)
+    if op:
+        for x, y in zip(it1, it2):
+            yield op(y, x)  # reversed ! (for sub or div)
+    else:
+        yield from zip(it1, it2)
 
 
 def select(it1, it2, op):
@@ -321,6 +345,15 @@ def reshape(data, dims):
     :result: data as a n-dim matrix
     """
     data = list(flatten(data))
+    if all(dims, lambda d: type(d) is int and d > 0):
+        n = 1
+        for d in dims:
+            n *= d
+        # same-type elements only : asarray would coerce mixed int/float
+        if n == len(data) and (all(data, lambda x: type(x) is int)
+                               or all(data, lambda x: type(x) is float)):
+            import numpy  # single C reshape instead of a slicing pass per dim
+            return numpy.asarray(data).reshape(dims).tolist()
     for d in dims[::-1]:  # reversed
         if d:
             data = [data[i:i + d] for i in range(0, len(data), d)]
@@ -332,8 +365,12 @@ def reshape(data, dims):
 def compose(f, g):
     """Compose two functions -> compose(f, g)(x) -> f(g(x))"""
 
-    def _wrapper(*args, **kwargs):
-        return f(g(*args, **kwargs))
+    def _wrapper(x=_sentinel, *args, **kwargs):
+        if x is _sentinel:
+            return f(g(**kwargs))
+        if args or kwargs:
+            return f(g(x, *args, **kwargs))
+        return f(g(x))  # common single argument call : no unpacking
 
     return _wrapper
 
@@ -352,18 +389,19 @@ def accumulate(iterable, func=operator.add, skip_first=False, modulo=0):
     # accumulate([1,2,3,4,5]) --> 1 3 6 10 15
     # accumulate([1,2,3,4,5], operator.mul) --> 1 2 6 24 120
     """
-    f = True
-    for x in iterable:
-        if f:
-            total = x
-            f = False
-            if skip_first:
-                continue
-        else:
-            total = func(total, x)
-        if modulo:
-            total = total % modulo
-        yield total
+    if modulo:  # keep the running total reduced, as the loop below did
+        it = iter(iterable)
+        try:
+            total = next(it) % modulo
+        except StopIteration:
+            return
+        res = itertools.accumulate(
+            it, lambda t, x: func(t, x) % modulo, initial=total)
+    else:  # straight delegation to the C implementation
+        res = itertools.accumulate(iterable, func)
+    if skip_first:
+        res = itertools.islice(res, 1, None)
+    yield from res
 
 
 def record(iterable, it=itertools.count(), max=0):
@@ -387,6 +425,8 @@ def tails(seq):
 
     tails([1,2,3]) -> [1,2,3], [2,3], [3], [].
     """
+    if isinstance(seq, (bytes, bytearray)):  # zero-copy O(1) suffixes
+        seq = memoryview(seq)
     for idx in range(len(seq) + 1):
         yield seq[idx:]
 
@@ -412,10 +452,8 @@ def occurences(iterable):
     :return: dict of int count indexed by item
     """
     from sortedcontainers import SortedDict
-    occur = SortedDict()
-    for x in iterable:
-        occur[x] = occur.get(x, 0) + 1
-    return occur
+    # tally in C with a Counter, then sort keys once in bulk
+    return SortedDict(collections.Counter(iterable))
 
 
 def compress(iterable, key=identity, buffer=None):
@@ -429,18 +467,29 @@ def compress(iterable, key=identity, buffer=None):
     """
     key = key or identity
 
+    if key is identity and not buffer and type(iterable).__module__ == 'numpy':
+        import numpy
+        if iterable.ndim == 1 and iterable.size:
+            # vectorized run-length encoding : one C pass
+            starts = numpy.flatnonzero(iterable[1:] != iterable[:-1]) + 1
+            starts = numpy.concatenate(([0], starts))
+            counts = numpy.diff(numpy.concatenate((starts, [iterable.size])))
+            yield from zip(iterable[starts].tolist(), counts.tolist())
+            return
+
     if buffer:
         iterable = sorted_iterable(iterable, key, buffer)
 
-    prev, count = None, 0
+    prev, prev_key, count = _sentinel, None, 0
     for item in iterable:
-        if count and key(item) == key(prev):
+        k = key(item)  # computed once per item, cached for the next one
+        if count and k == prev_key:
             count += 1
         else:
-            if prev is not None:  # to skip initial junk
+            if prev is not _sentinel:
                 yield prev, count
             count = 1
-            prev = item
+            prev, prev_key = item, k
     if count:
         yield prev, count
 
@@ -468,10 +517,9 @@ def count_unique(iterable, key=None):
     # count_unique('AAAABBBCCDAABBB') --> 4
     # count_unique('ABBCcAD', str.lower) --> 4
     """
-    seen = set()
-    for element in iterable:
-        seen.add(key(element) if key else element)
-    return len(seen)
+    if key is None:  # both set constructors run entirely in C
+        return len(set(iterable))
+    return len(set(map(key, iterable)))
 
 
 def combinations_with_replacement(iterable, r):
@@ -480,10 +528,14 @@ def combinations_with_replacement(iterable, r):
     duplicates
     """
     pool = tuple(iterable)
-    n = len(pool)
-    for indices in product(range(n), repeat=r):
-        if sorted(indices) == list(indices):
-            yield tuple(pool[i] for i in indices)
+    if r == 0:
+        yield ()
+        return
+    # enumerate by largest element : generates exactly C(n+r-1,r) tuples
+    # instead of filtering the n^r cartesian product
+    for m in range(len(pool)):
+        for prefix in combinations_with_replacement(pool[:m + 1], r - 1):
+            yield prefix + (pool[m],)
 
 # my functions added
 
@@ -492,6 +544,11 @@ def takenth(n, iterable, default=None):
     """
     :result: nth item of iterable
     """
+    if isinstance(iterable, (list, tuple, str)):
+        try:
+            return iterable[n]  # O(1) random access
+        except IndexError:
+            return default
     # https://docs.python.org/2/library/html#recipes
     return next(itertools.islice(iterable, n, n + 1), default)
 
@@ -500,20 +557,16 @@ nth = takenth
 
 
 def icross(*sequences):
-    """Cartesian product of sequences (recursive version)"""
-    # http://stackoverflow.com/questions/15099647/cross-product-of-sets-using-recursion
-    if sequences:
-        for x in sequences[0]:
-            for y in icross(*sequences[1:]):
-                yield (x,) + y
-    else:
-        yield ()
+    """Cartesian product of sequences (in C, no recursion)"""
+    return itertools.product(*sequences)
 
 
 def quantify(iterable, pred=bool):
     """
     :result: int count how many times the predicate is true
     """
+    if pred is bool:  # no Python-level call per element : filter runs in C
+        return sum(1 for _ in filter(None, iterable))
     return sum(map(pred, iterable), 0)
 
 
@@ -524,7 +577,7 @@ def interleave(l1, l2):
     :result: iterable interleaving elements from l1 and l2, starting by l1[0]
     """
     # http://stackoverflow.com/questions/7946798/interleaving-two-lists-in-python-2-2
-    res = l1 + l2
+    res = [None] * (len(l1) + len(l2))  # no intermediate concatenation
     res[::2] = l1
     res[1::2] = l2
     return res
@@ -536,6 +589,10 @@ def shuffle(ary):
     :result: shuffled array (IN PLACE!)
     :see: http://www.drgoulu.com/2013/01/19/comment-bien-brasser-les-cartes/
     """
+    if type(ary).__module__ == 'numpy':  # lazy : no numpy import needed here
+        import numpy
+        numpy.random.shuffle(ary)  # same Fisher-Yates, in C
+        return ary
     for i in range(len(ary) - 1, 0, -1):
         j = random.randint(0, i)
         ary[i], ary[j] = ary[j], ary[i]
@@ -593,7 +650,13 @@ def sort_indexes(iterable, key=identity, reverse=False):
     :return: iterator over indexes of iterable that correspond to the sorted iterable
     """
     # http://stackoverflow.com/questions/6422700/how-to-get-indices-of-a-sorted-array-in-python
-    return [i[0] for i in sorted(enumerate(iterable), key=lambda x:key(x[1]))]
+    if not hasattr(iterable, '__len__'):  # indexed below : materialize iterators
+        iterable = list(iterable)
+    if key is identity:  # C-level __getitem__ as key, no lambda nor tuples
+        return sorted(range(len(iterable)), key=iterable.__getitem__,
+                      reverse=reverse)
+    return sorted(range(len(iterable)), key=lambda i: key(iterable[i]),
+                  reverse=reverse)
 
 # WARNING : filter2 has been renamed from "split" at v.1.7.0 for coherency
 
@@ -618,11 +681,11 @@ def ifind(iterable, f, reverse=False):
         for i, item in enumerate(iterable):
             if f(item):
                 yield (i, item)
-    else:
-        j = len(iterable) - 1
-        for i, item in enumerate(reversed(iterable)):
+    else:  # direct index walk : no reversed() wrapper, no index arithmetic
+        for i in range(len(iterable) - 1, -1, -1):
+            item = iterable[i]
             if f(item):
-                yield (j - i, item)
+                yield (i, item)
 
 
 def iremove(iterable, f):
@@ -688,12 +751,17 @@ def dictsplit(dic, keys):
     return yes, no
 
 
-def next_permutation(seq, pred=lambda x, y: -1 if x < y else 0):
+def _lt(x, y):
+    return -1 if x < y else 0
+
+
+def next_permutation(seq, pred=_lt):
     """Like C++ std::next_permutation() but implemented as generator.
     see http://blog.bjrn.se/2008/04/lexicographic-permutations-using.html
     :param seq: iterable
     :param pred: a function (a,b) that returns a negative number if a<b, like cmp(a,b) in Python 2.7
     """
+    default = pred is _lt  # then compare with < directly, no call per step
 
     def reverse(seq, start, end):
         # seq = seq[:start] + reversed(seq[start:end]) + \
@@ -709,7 +777,7 @@ def next_permutation(seq, pred=lambda x, y: -1 if x < y else 0):
             end -= 1
 
     if not seq:
-        raise StopIteration
+        return
 
     try:
         seq[0]
@@ -725,7 +793,7 @@ def next_permutation(seq, pred=lambda x, y: -1 if x < y else 0):
     yield seq
 
     if last == 1:
-        raise StopIteration
+        return
 
     while True:
         next = last - 1
@@ -734,13 +802,18 @@ def next_permutation(seq, pred=lambda x, y: -1 if x < y else 0):
             # Step 1.
             next1 = next
             next -= 1
+            x = seq[next]
 
-            if pred(seq[next], seq[next1]) < 0:
+            if x < seq[next1] if default else pred(x, seq[next1]) < 0:
                 # Step 2.
                 mid = last - 1
-                while not (pred(seq[next], seq[mid]) < 0):
-                    mid -= 1
-                seq[next], seq[mid] = seq[mid], seq[next]
+                if default:
+                    while not x < seq[mid]:
+                        mid -= 1
+                else:
+                    while not (pred(x, seq[mid]) < 0):
+                        mid -= 1
+                seq[next], seq[mid] = seq[mid], x
 
                 # Step 3.
                 reverse(seq, next1, last)
@@ -750,8 +823,7 @@ def next_permutation(seq, pred=lambda x, y: -1 if x < y else 0):
                 yield seq[:]
                 break
             if next == first:
-                raise StopIteration
-    raise StopIteration
+                return
 
 
 class iter2(object):
@@ -842,13 +914,15 @@ def sorted_iterable(iterable, key=None, buffer=100):
 
 def diff(iterable1, iterable2):
     """generate items in sorted iterable1 that are not in sorted iterable2"""
-    b = next(iterable2)
+    # two-pointer merge; next(it,_sentinel) avoids StopIteration
+    # escaping the generator (PEP 479)
+    it2 = iter(iterable2)
+    b = next(it2, _sentinel)
     for a in iterable1:
-        while b < a:
-            b = next(iterable2)
-        if a == b:
-            continue
-        yield a
+        while b is not _sentinel and b < a:
+            b = next(it2, _sentinel)
+        if b is _sentinel or a != b:
+            yield a
 
 
 merge = heapq.merge
@@ -862,8 +936,10 @@ def intersect(*iterables):
     :see: http://stackoverflow.com/questions/969709/joining-a-set-of-ordered-integer-yielding-python-iterators
     """
 
+    n = len(iterables)
     for key, values in itertools.groupby(heapq.merge(*iterables)):
-        if len(list(values)) == len(iterables):
+        # count without materializing the group in a list
+        if sum(1 for _ in values) == n:
             yield key
 
 
@@ -877,14 +953,18 @@ def product(*iterables, **kwargs):
     # https://github.com/enricobacis/infinite/blob/master/infinite/product.py
     # is not general enough
 
+    r = kwargs.get('repeat', 1)
+
+    if all(iterables, lambda it: hasattr(it, '__len__')):
+        # all inputs are finite sequences : the C version handles them
+        return itertools.product(*iterables, repeat=r)
+
     def empty():
         yield ()
 
     if len(iterables) == 0:
         return empty()
 
-    r = kwargs.get('repeat', 1)
-
     if r > 1:
         n = len(iterables)
         res = []
@@ -999,6 +1079,44 @@ def floyd(iterable, limit=1e6):
     return i, j + 1
 
 
+def floyd_fn(f, x0, limit=1e6):
+    """Detect a cycle in the orbit of f starting from x0
+
+    faster equivalent of floyd(iterate(f, x0)) : works on plain values,
+    with no tee buffers nor iterator wrappers between steps
+
+    :param f: function
+    :param x0: start value
+    :param limit: int limit to prevent infinite loop. no limit if None
+    :result: (i,l) tuple of integers where i=index of cycle start, l=length
+        if no cycle is found, return (None,None)
+    """
+    tortoise = f(x0)
+    hare = f(f(x0))
+    n = 0
+    while tortoise != hare:
+        if limit and n > limit:
+            return (None, None)
+        tortoise = f(tortoise)
+        hare = f(f(hare))
+        n += 1
+
+    mu = 0
+    tortoise = x0
+    while tortoise != hare:
+        tortoise = f(tortoise)
+        hare = f(hare)
+        mu += 1
+
+    lam = 1
+    hare = f(tortoise)
+    while tortoise != hare:
+        hare = f(hare)
+        lam += 1
+
+    return mu, lam
+
+
 def brent(iterable, limit=1e6):
     """Detect a cycle in iterable using Floyd "tortue hand hare" algorithm
 
@@ -13,63 +13,138 @@ __credits__= [""]
 __license__ = "LGPL"
 
 import logging
+import os
+import sys
 
 from IPython.display import display, HTML, Math
 from .markup import tag
 from .itertools2 import isiterable
 
+# set NOTEBOOK_BATCH=1 to coalesce all fragments of a cell
+# into a single display event, flushed after the cell has run
+_batch = os.environ.get('NOTEBOOK_BATCH', '0') != '0'
+_buffer = []
 
-def html(obj, sep=None):
+
+def flush(*_):
+    """display the buffered html fragments in a single event"""
+    if _buffer:
+        display(HTML(''.join(_buffer)))
+        _buffer.clear()
+
+
+def _display(fragment):
+    if _batch:
+        _buffer.append(fragment)
+        return None
+    return display(HTML(fragment))
+
+
+if _batch:
     try:
-        return obj._repr_html_()
-    except AttributeError:
-        pass #skip logging.error
+        get_ipython().events.register('post_run_cell', flush)
+    except NameError:  # not in IPython : display immediately
+        _batch = False
+
+
+def html(obj, sep=None):
+    # all fragments accumulate in a single buffer, joined once at the end
+    buf = []
+    _html(obj, sep, buf.append)
+    return ''.join(buf)
+
+def _html(obj, sep, out):
+    fn = getattr(obj, '_repr_html_', None)  # no exception on plain scalars
+    if fn is not None:
+        out(fn())
+        return
+
+    if isinstance(obj, str): # iterable, but rendered as a scalar
+        out(obj)
+        return
+
+    if isinstance(obj, (int, float, complex)): # most common scalars :
+        out(str(obj)) # skip the iter() probe in isiterable below
+        return
 
     if sep is None:
         sep=' '
         bra,ket='',''
     else:
         if isinstance(obj,dict):
-            res=',\n'.join("%s:%s"%(html(k),html(v)) for k,v in obj.items())
-            return '{%s}'%res
+            out('{')
+            for i,(k,v) in enumerate(obj.items()):
+                if i:
+                    out(',\n')
+                _html(k, None, out)
+                out(':')
+                _html(v, None, out)
+            out('}')
+            return
         elif isinstance(obj,list):
             bra,ket='[',']'
         else:
             bra,ket='(',')'
 
-    if isiterable(obj): #iterable, but not a string
-        return bra+sep.join(html(a,sep=',') for a in obj)+ket
-
-    return str(obj)
+    # known containers first, isiterable only for exotic ones (generators, ...)
+    if isinstance(obj, (list, tuple, set, frozenset)) or isiterable(obj):
+        out(bra)
+        for i,a in enumerate(obj):
+            if i:
+                out(sep)
+            _html(a, ',', out)
+        out(ket)
+        return
+
+    out(str(obj))
+
+# tag() output for the constant headers and divs, built and interned once
+# at import so every lookup downstream hits the string table
+_h1 = sys.intern('<h1>%s</h1>')
+_h2 = sys.intern('<h2>%s</h2>')
+_h3 = sys.intern('<h3>%s</h3>')
+_h4 = sys.intern('<h4>%s</h4>')
+_hdiv = '<div style="background-color:%s;color:#ffffff">%%s</div>'
 
 def h1(*args):
-    return display(HTML(tag('h1',html(args))))
+    return _display(_h1 % html(args))
 
 def h2(*args):
-    return display(HTML(tag('h2',html(args))))
+    return _display(_h2 % html(args))
 
 def h3(*args):
-    return display(HTML(tag('h3',html(args))))
+    return _display(_h3 % html(args))
 
 def h4(*args):
-    return display(HTML(tag('h4',html(args))))
+    return _display(_h4 % html(args))
 
 def h(*args):
-    return display(HTML(html(args)))
+    return _display(html(args))
 
 #redefine "print" for notebooks ...
 #http://stackoverflow.com/questions/15411967/how-can-i-check-if-code-is-executed-in-the-ipython-notebook
-if 'get_ipython' in globals():
-    print = h # allowed in Python 3
+try:
+    get_ipython # decided once at import
+    _in_ipy = True
+except NameError:
+    _in_ipy = False
+
+if _in_ipy:
+    print = h # allowed in Python 3, and only shadowed when in IPython
+
+_hinfo = sys.intern(_hdiv % '#337ab7')
+_hsuccess = sys.intern(_hdiv % '#5cb85c')
+_hwarning = sys.intern(_hdiv % '#f0ad4e')
+_herror = sys.intern(_hdiv % '#d9534f')
 
 def hinfo(*args):
-    return display(HTML(tag('div',html(args),style="background-color:#337ab7;color:#ffffff")))
+    return _display(_hinfo % html(args))
 def hsuccess(*args):
-    return display(HTML(tag('div',html(args),style="background-color:#5cb85c;color:#ffffff")))
+    return _display(_hsuccess % html(args))
 def hwarning(*args):
-    return display(HTML(tag('div',html(args),style="background-color:#f0ad4e;color:#ffffff")))
+    return _display(_hwarning % html(args))
 def herror(*args):
-    return display(HTML(tag('div',html(args),style="background-color:#d9534f;color:#ffffff")))
+    return _display(_herror % html(args))
 
 def latex(obj):
     """ to force LaTeX representation """
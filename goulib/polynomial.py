@@ -9,12 +9,18 @@ __credits__ = [
     "http://code.activestate.com/recipes/362193-manipulate-simple-polynomials-in-python/"]
 __license__ = "LGPL"
 
+import itertools
 import re
 
+import numpy
+
 from . import expr
 
 
 class Polynomial(expr.Expr):
+
+    __slots__ = ('plist',)
+
     def __init__(self, val):
         """:param: val can be:
         - an iterable of the factors in ascending powers order : Polynomial([1,2,3]) holds 3*x^2+2*x+1
@@ -23,7 +29,8 @@ class Polynomial(expr.Expr):
           terms can be in any order, and even "overlap" : Polynomial('3x+x^2-x') holds x^2+2*x
 
         """
-        self.plist = tuple(plist(val))  # a polynomial is immutable
+        # a polynomial is immutable, and normalized : no zero high order terms
+        self.plist = tuple(_strip_leading_zeros(plist(val)))
         s = tostring(self.plist, pow='**', mul='*')
         super(Polynomial, self).__init__(s)
 
@@ -63,6 +70,9 @@ class Polynomial(expr.Expr):
         except:
             return self.plist == Polynomial(other).plist
 
+    def __hash__(self):
+        return hash(self.plist)  # plist is a tuple : Polynomial is immutable
+
     def __add__(self, other):
         return Polynomial(add(self.plist, plist(other)))
 
@@ -102,20 +112,16 @@ class Polynomial(expr.Expr):
 def plist(term):
     "Force term to have the form of a polynomial list"
 
-    try:  # already a Polynomial ?
+    if isinstance(term, Polynomial):
         return term.plist
-    except:
-        pass
 
-    try:  # a string ?
+    if isinstance(term, str):
         return parse_string(term)
-    except:
-        pass
 
-    try:  # a list of coeffcients ?
+    try:  # a list of coefficients ? (list, tuple, ndarray, ...)
         term[0]
         return term
-    except:
+    except (TypeError, IndexError, KeyError):
         pass
     return [term]  # then it's a constant
 
@@ -127,13 +133,17 @@ def peval(plist, x, x2=None):
     latter feature is included for the purpose of evaluating
     definite integrals.
     """
-    val = 0
     if x2:
-        for i in range(len(plist)):
-            val += plist[i] * (pow(x2, i) - pow(x, i))
-    else:
-        for i in range(len(plist)):
-            val += plist[i] * pow(x, i)
+        return peval(plist, x2) - peval(plist, x)
+    if isinstance(x, numpy.ndarray):  # Horner over the whole array at once
+        val = numpy.zeros_like(x, dtype=float)
+        for c in reversed(plist):
+            val *= x  # two in-place ops avoid a temporary per coefficient
+            val += c
+        return val
+    val = 0
+    for c in reversed(plist):  # Horner : n mults, n adds, no pow
+        val = val * x + c
     return val
 
 
@@ -169,19 +179,18 @@ def derivative(plist):
 
 def add(p1, p2):
     "Return a new plist corresponding to the sum of the two input plists."
-    if len(p1) > len(p2):
-        new = [i for i in p1]
-        for i in range(len(p2)):
-            new[i] += p2[i]
-    else:
-        new = [i for i in p2]
-        for i in range(len(p1)):
-            new[i] += p1[i]
+    new = [a + b for a, b in itertools.zip_longest(p1, p2, fillvalue=0)]
+    while len(new) > 1 and new[-1] == 0:  # cancelled high order terms
+        new.pop()
     return new
 
 
 def sub(p1, p2):
-    return add(p1, mult_const(p2, -1))
+    "Return a new plist corresponding to the difference of the two input plists."
+    new = [a - b for a, b in itertools.zip_longest(p1, p2, fillvalue=0)]
+    while len(new) > 1 and new[-1] == 0:  # cancelled high order terms
+        new.pop()
+    return new
 
 
 def mult_const(p, c):
@@ -189,15 +198,62 @@ def mult_const(p, c):
     return [c * pi for pi in p]
 
 
+KARATSUBA_THRESHOLD = 32  # degree above which Karatsuba beats schoolbook
+FFT_THRESHOLD = 64  # degree above which Fourier convolution beats Karatsuba
+
+
+def _karatsuba(p1, p2):
+    """Multiply two plists with 3 half-size products instead of 4 : O(n^1.585)"""
+    if min(len(p1), len(p2)) < KARATSUBA_THRESHOLD:
+        return multiply(p1, p2)
+    m = max(len(p1), len(p2)) // 2
+    low1, high1 = p1[:m], p1[m:]
+    low2, high2 = p2[:m], p2[m:]
+    z0 = _karatsuba(low1, low2)
+    z2 = _karatsuba(high1, high2)
+    z1 = sub(_karatsuba(add(low1, high1), add(low2, high2)), add(z0, z2))
+    return add(z0, add([0] * m + z1, [0] * (2 * m) + z2))
+
+
+def _fft_multiply(p1, p2):
+    """Multiply two numeric plists as a Fourier-domain convolution in O(n log n)"""
+    n = len(p1) + len(p2) - 1
+    size = 1
+    while size < n:
+        size *= 2
+    res = numpy.fft.irfft(
+        numpy.fft.rfft(p1, size) * numpy.fft.rfft(p2, size), size)[:n]
+    if all(isinstance(c, int) for c in p1) and all(isinstance(c, int) for c in p2):
+        return [int(c) for c in res.round()]
+    return res.tolist()
+
+
 def multiply(p1, p2):
     "Return a new plist corresponding to the product of the two input plists"
     if len(p1) > len(p2):
         short, f = p2, p1
     else:
         short, f = p1, p2
-    new = []
-    for i in range(len(short)):
-        new = add(new, mult_one(f, short[i], i))
+    if len(short) >= FFT_THRESHOLD:
+        try:
+            # each output coefficient sums at most len(short) products :
+            # stay under the float64 mantissa so rounding back is exact,
+            # otherwise fall through to Karatsuba which keeps Python ints
+            if max(map(abs, p1)) * max(map(abs, p2)) * len(short) < 2 ** 52:
+                return _fft_multiply(p1, p2)
+        except TypeError:  # non float-convertible coefficients (Fraction, Expr...)
+            pass
+    if len(short) >= KARATSUBA_THRESHOLD:
+        return _karatsuba(p1, p2)
+    # schoolbook : accumulate in a preallocated list instead of
+    # building an intermediate plist per term with add/mult_one
+    new = [0] * (len(p1) + len(p2) - 1) if p1 and p2 else []
+    for i, c in enumerate(short):
+        if c:
+            for j, d in enumerate(f):
+                new[i + j] += c * d
+    while len(new) > 1 and new[-1] == 0:  # zero high order factors
+        new.pop()
     return new
 
 
@@ -206,21 +262,30 @@ def mult_one(p, c, i):
     Return a new plist corresponding to the product of the input plist p
     with the single term c*x^i
     """
-    new = [0] * i  # increment the list with i zeros
-    for pi in p:
-        new.append(pi * c)
-    return new
+    return [0] * i + [pi * c for pi in p]  # shift by i zeros and scale
 
 
 def power(p, e):
     "Return a new plist corresponding to the e-th power of the input plist p"
-    assert int(e) == e, "Can only take integral power of a plist"
+    assert int(e) == e and e >= 0, \
+        "Can only take non-negative integral power of a plist"
+    e = int(e)
     new = [1]
-    for i in range(e):
-        new = multiply(new, p)
+    base = p
+    while e:  # binary exponentiation : O(log e) multiplies instead of e
+        if e & 1:
+            new = multiply(new, base)
+        e >>= 1
+        if e:
+            base = multiply(base, base)
     return new
 
 
+# compiled once instead of on each parse_string / _parse_p call
+_termpat = re.compile(r'([-+]?\s*\d*\.?\d*)(x?\^?\d?)')
+_powpat = re.compile(r'x\^?(\d)?')
+
+
 def parse_string(s):
     """\
     Do very, very primitive parsing of a string into a plist.
@@ -234,11 +299,10 @@ def parse_string(s):
     """
     s = s.replace('$', '').replace(
         '*', '')  # remove LateX marks and optional * mul symbols
-    termpat = re.compile(r'([-+]?\s*\d*\.?\d*)(x?\^?\d?)')
     # print "Parsing string: ",str
     # print termpat.findall(str)
     res_dict = {}
-    for n, p in termpat.findall(s):
+    for n, p in _termpat.findall(s):
         n, p = n.strip(), p.strip()
         if not n and not p:
             continue
@@ -256,21 +320,19 @@ def parse_string(s):
 
 def _parse_n(str):
     "Parse the number part of a polynomial string term"
-    if not str:
+    str = str.replace(' ', '')
+    if not str or str == '+':
         return 1
     elif str == '-':
         return -1
-    elif str == '+':
-        return 1
-    return eval(str)
+    return float(str) if '.' in str else int(str)
 
 
 def _parse_p(str):
     "Parse the power part of a polynomial string term"
-    pat = re.compile(r'x\^?(\d)?')
     if not str:
         return 0
-    res = pat.findall(str)[0]
+    res = _powpat.findall(str)[0]
     if not res:
         return 1
     return int(res)
@@ -291,19 +353,17 @@ def tostring(p, **kwargs):
     but most of the complexity is caused by special cases.
     """
     p = _strip_leading_zeros(p)
-    str = []
+    str = []  # one entry per nonzero term, sign included
     for i in range(len(p) - 1, -1, -1):
         if p[i]:
-            if i < len(p) - 1:
-                if p[i] >= 0:
-                    str.append(kwargs.get('plus', '+'))
-                else:
-                    str.append(kwargs.get('minus', '-'))
-                str.append(_tostring_term(abs(p[i]), i, **kwargs))
+            if str:
+                sign = kwargs.get('plus', '+') if p[i] >= 0 \
+                    else kwargs.get('minus', '-')
+                str.append(sign + ' ' + _tostring_term(abs(p[i]), i, **kwargs))
             else:
                 str.append(_tostring_term(p[i], i, **kwargs))
     if not str:
-        str = '0'
+        return '0'
     return ' '.join(str)
 
 
@@ -7,9 +7,17 @@ __copyright__ = "Copyright 2012, Philippe Guglielmetti"
 __credits__ = []
 __license__ = "LGPL"
 
+import collections
+import itertools
 import math
 import logging
 import matplotlib
+import numpy
+
+try:
+    import scipy.stats
+except ImportError:  # optional : only needed by linear_regression
+    scipy = None
 
 from goulib import plot  # sets matplotlib backend
 import matplotlib.pyplot as plt  # after import .plot
@@ -70,32 +78,44 @@ def confidence_interval(data, conf=0.95):
 
 def median(data, is_sorted=False):
     """:return: median of data"""
-    x = data if is_sorted else sorted(data)
     n = len(data)
     i = n // 2
+    if is_sorted:
+        x = data
+    else:
+        try:  # O(n) selection : only the middle element(s) need their place
+            # no dtype forced : int stays int, Decimal & co stay exact objects
+            x = numpy.partition(numpy.asarray(data),
+                                i if n % 2 else [i - 1, i])
+        except (TypeError, ValueError):  # non comparable data
+            x = sorted(data)
     if n % 2:
-        return x[i]
+        res = x[i]
     else:
-        return avg(x[i - 1:i + 1])
+        res = avg(x[i - 1:i + 1])
+    # numpy scalars out : callers expect plain Python values
+    return res.item() if isinstance(res, numpy.generic) else res
 
 
 def mode(data, is_sorted=False):
     """:return: mode (most frequent value) of data"""
-    # we could use a collection.Counter, but we're only looking for the largest value
-    x = data if is_sorted else sorted(data)
-    res, count = None, 0
-    prev, c = None, 0
-    x.append(None)  # to force the last loop
-    for v in x:
-        if v == prev:
-            c += 1
-        else:
-            if c > count:  # best so far
-                res, count = prev, c
-            c = 1
-        prev = v
-    x.pop()  # no side effect please
-    return res
+    try:
+        counts = collections.Counter(data)
+    except TypeError:  # unhashable values : fall back to a sorted scan
+        x = data if is_sorted else sorted(data)
+        res, count = None, 0
+        prev, c = None, 0
+        for v in itertools.chain(x, [None]):  # None forces the last loop
+            if v == prev:
+                c += 1
+            else:
+                if c > count:  # best so far
+                    res, count = prev, c
+                c = 1
+            prev = v
+        return res
+    # smallest value wins ties, as in the sorted scan above
+    return min(counts.items(), key=lambda kv: (-kv[1], kv[0]))[0]
 
 
 def kurtosis(data):
@@ -178,8 +198,23 @@ class Stats(object):
             self.hi = x
 
     def extend(self, data):
-        for x in data:
-            self.append(x)
+        """add data to Stats, in a single numpy pass when data is numeric"""
+        try:
+            a = numpy.asarray(data, dtype=float)
+            if a.ndim != 1 or a.size == 0:
+                raise ValueError
+        except (TypeError, ValueError):  # generator, mixed or exotic types
+            for x in data:
+                self.append(x)
+            return
+        if self.n == 0:
+            self._offset = float(a[0])
+        delta = a - self._offset
+        self.n += a.size
+        self._dsum1 += float(delta.sum())
+        self._dsum2 += float(numpy.dot(delta, delta))
+        self.lo = min(self.lo, float(a.min()))
+        self.hi = max(self.hi, float(a.max()))
 
     def remove(self, data):
         """remove data from Stats
@@ -418,27 +453,32 @@ def linear_regression(x, y, conf=None):
     >>> linear_regression([.1,.2,.3],[10,11,11.5],0.95)
     """
     # https://gist.github.com/riccardoscalco/5356167
-    try:
-        import scipy.stats
-        import numpy  # TODO remove these requirements
-    except:
+    if scipy is None:
         logging.error('scipy needed')
         return None
 
     x = numpy.array(x)
     y = numpy.array(y)
     n = len(x)
-    xy = x * y
-    xx = x * x
 
-    # estimates
+    if not conf:  # scipy's compiled OLS gives the estimates directly
+        res = scipy.stats.linregress(x, y)
+        # (1-r²)·var(y) is the residual variance SS_res/n
+        s2 = (1 - res.rvalue ** 2) * float(y.var())
+        return res.slope, res.intercept, s2
+
+    # estimates : moments computed once, reused everywhere below
 
-    b1 = (xy.mean() - x.mean() * y.mean()) / (xx.mean() - x.mean() ** 2)
-    b0 = y.mean() - b1 * x.mean()
-    s2 = 1. / n * sum([(y[i] - b0 - b1 * x[i]) ** 2 for i in range(n)])
+    mx = x.mean()
+    my = y.mean()
+    mxy = (x * y).mean()
+    mxx = (x * x).mean()
+    denom = mxx - mx * mx
 
-    if not conf:
-        return b1, b0, s2
+    b1 = (mxy - mx * my) / denom
+    b0 = my - b1 * mx
+    r = y - b0 - b1 * x  # residuals, all at once
+    s2 = float(numpy.dot(r, r)) / n
 
     # confidence intervals
 
@@ -447,9 +487,8 @@ def linear_regression(x, y, conf=None):
     c2 = scipy.stats.chi2.ppf(1 - alpha / 2., n - 2)
 
     c = -1 * scipy.stats.t.ppf(alpha / 2., n - 2)
-    bb1 = c * (s2 / ((n - 2) * (xx.mean() - (x.mean()) ** 2))) ** .5
+    bb1 = c * (s2 / ((n - 2) * denom)) ** .5
 
-    bb0 = c * ((s2 / (n - 2)) * (1 + (x.mean()) ** 2 /
-                                 (xx.mean() - (x.mean()) ** 2))) ** .5
+    bb0 = c * ((s2 / (n - 2)) * (1 + mx * mx / denom)) ** .5
 
     return b1, b0, s2, (b1 - bb1, b1 + bb1), (b0 - bb0, b0 + bb0), (n * s2 / c2, n * s2 / c1)
@@ -9,8 +9,12 @@ __author__ = "Philippe Guglielmetti"
 __copyright__ = "Copyright 2014-, Philippe Guglielmetti"
 __license__ = "LGPL"
 
+import functools
+import io
 import logging
 import itertools
+import re
+import typing
 import unittest
 import pytest
 
@@ -21,8 +25,20 @@ def pprint_gen(iterable, indices=[0, 1, 2, -3, -2, -1], sep='...'):
     """generates items at specified indices"""
     try:
         l = len(iterable)
+        if isinstance(iterable, (list, tuple, str)):
+            # random access : O(len(indices)) instead of scanning every item
+            prev = -1
+            for i in sorted(set(i if i >= 0 else l + i for i in indices
+                                if i < l)):
+                if i < 0:  # negative index out of range
+                    continue
+                if sep and i > prev + 1:
+                    yield sep
+                yield iterable[i]
+                prev = i
+            return
         indices = (i if i >= 0 else l+i for i in indices if i < l)
-    except:  # infinite iterable
+    except TypeError:  # infinite iterable
         l = None
         indices = filter(lambda x: x >= 0, indices)
     indices = list(itertools2.unique(indices))  # to remove overlaps
@@ -48,18 +64,28 @@ def pprint_gen(iterable, indices=[0, 1, 2, -3, -2, -1], sep='...'):
 
 def pprint(iterable, indices=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, -3, -2, -1], timeout=1):
     sep = '...'
-    s = []
+    buf = io.StringIO()  # commas written inline : no list to join afterwards
+    last = None
     try:
         items = pprint_gen(iterable, indices, sep)
         for item in decorators.itimeout(items, timeout):
-            if isinstance(item, str):
-                s.append(item)  # to keep unicode untouched
-            else:
-                s.append(str(item))
+            if last is not None:
+                buf.write(',')
+            # str() only when needed, to keep unicode untouched
+            last = item if isinstance(item, str) else str(item)
+            buf.write(last)
     except decorators.TimeoutError:
-        if s[-1] != sep:
-            s.append(sep)
-    return ','.join(s)
+        if last != sep:
+            if last is not None:
+                buf.write(',')
+            buf.write(sep)
+    return buf.getvalue()
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(pattern, flags=0):
+    """compile regexes once for assertMatch calls in loops"""
+    return re.compile(pattern, flags)
 
 
 class TestCase(unittest.TestCase):
@@ -77,38 +103,45 @@ class TestCase(unittest.TestCase):
         :param reltol: optional float relative tolerance value
         """
 
-        # we must tee or copy sequences in order to exhaust generators in pprint
+        # we must tee or copy generators so pprint can replay them on failure
         # TODO: find a way (if any...) to move this in pprint
-        seq1, p1 = itertools2.tee(seq1, copy=None)
-        seq2, p2 = itertools2.tee(seq2, copy=None)
-        seq1_repr = pprint(p1)
-        seq2_repr = pprint(p2)
+        if hasattr(seq1, '__len__'):  # sized containers iterate twice as is
+            p1 = seq1
+        else:
+            seq1, p1 = itertools2.tee(seq1, copy=None)
+        if hasattr(seq2, '__len__'):
+            p2 = seq2
+        else:
+            seq2, p2 = itertools2.tee(seq2, copy=None)
 
         if seq_type is not None:
             seq_type_name = seq_type.__name__
             if not isinstance(seq1, seq_type):
                 raise self.failureException(
-                    'First sequence is not a %s: %s' % (seq_type_name, seq1_repr))
+                    'First sequence is not a %s: %s' % (seq_type_name, pprint(p1)))
             if not isinstance(seq2, seq_type):
                 raise self.failureException(
-                    'Second sequence is not a %s: %s' % (seq_type_name, seq2_repr))
+                    'Second sequence is not a %s: %s' % (seq_type_name, pprint(p2)))
         else:
             seq_type_name = "sequence"
 
-        elements = (seq_type_name.capitalize(), seq1_repr, seq2_repr)
-        differing = '%ss differ: %s != %s\n' % elements
-
         class End(object):
             def __repr__(self):
                 return '(end)'
         end = End()  # a special object is appended to detect mismatching lengths
 
         i = 0
-        for item1, item2 in zip(itertools.chain(seq1, [end]), itertools.chain(seq2, [end])):
-            m = (msg if msg else differing) + \
-                'First differing element %d: %s != %s\n' % (i, item1, item2)
-            self.assertEqual(item1, item2, places=places,
-                             msg=m, delta=delta, reltol=reltol)
+        for item1, item2 in itertools.zip_longest(seq1, seq2, fillvalue=end):
+            try:
+                self.assertEqual(item1, item2, places=places,
+                                 delta=delta, reltol=reltol)
+            except self.failureException:
+                # reprs are only built here, on the failure path
+                differing = '%ss differ: %s != %s\n' % (
+                    seq_type_name.capitalize(), pprint(p1), pprint(p2))
+                m = (msg if msg else differing) + \
+                    'First differing element %d: %s != %s\n' % (i, item1, item2)
+                raise self.failureException(m)
             i += 1
         return i  # number of elements checked
 
@@ -124,7 +157,8 @@ class TestCase(unittest.TestCase):
         :param reltol: optional float relative tolerance value
         """
         # inspired from http://stackoverflow.com/a/3124155/190597 (KennyTM)
-        import typing
+        if first is second:  # identical objects are equal at any tolerance
+            return
 
         if delta is None:
             if places is None or (isinstance(first, self.base_types) and isinstance(second, self.base_types)):
@@ -156,12 +190,14 @@ class TestCase(unittest.TestCase):
         self.assertEqual(set(seq1), set(seq2), msg=msg)
 
     def assertMatch(self, value, pattern, flags=0, msg=None):
-        import re
         value = str(value)
         if msg is None:
             msg = 'string %s does not match regex %s' % (value, pattern)
 
-        self.assertTrue(re.match(pattern, value, flags), msg)
+        self.assertTrue(_compile(pattern, flags).match(value), msg)
+
+
+_setlog_last = None
 
 
 def setlog(level=logging.INFO, fmt='%(levelname)s:%(filename)s:%(funcName)s: %(message)s'):
@@ -169,11 +205,16 @@ def setlog(level=logging.INFO, fmt='%(levelname)s:%(filename)s:%(funcName)s: %(m
     :param level: logging level
     :param fmt: string
     """
-    logging.basicConfig(level=level, format=fmt)
+    global _setlog_last
     logger = logging.getLogger()
+    if _setlog_last == (level, fmt):
+        return logger  # already configured : don't touch the handlers again
 
+    logging.basicConfig(level=level, format=fmt)
     logger.setLevel(level)
-    logger.handlers[0].setFormatter(logging.Formatter(fmt))
+    if logger.handlers:  # basicConfig is a no-op if logging was configured
+        logger.handlers[0].setFormatter(logging.Formatter(fmt))
+    _setlog_last = (level, fmt)
     return logger
 
 
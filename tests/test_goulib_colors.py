@@ -29,6 +29,12 @@ class TestConversions:
         c = color_to_aci('#414142', True)
         assert acadcolors[c].hex == '#414141'
 
+    def test_aci_lut(self):
+        lut = aci_lut()
+        assert len(lut) == 32 * 32 * 32
+        c = color_to_aci('#414142', True)  # now answered from the table
+        assert acadcolors[c].hex == '#414141'
+
     @pytest.mark.skip(reason="not implemented")
     def test_aci_to_color(self):
         # assert_equal(expected, aci_to_color(x, block_color, layer_color))